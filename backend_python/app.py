@@ -4,6 +4,7 @@ from config import Config
 from database import db, connect_db
 from routes_auth import auth_bp
 from routes_students import students_bp
+from models import Student
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -35,6 +36,13 @@ def not_found(error):
 def server_error(error):
     return jsonify({'message': 'Internal Server Error'}), 500
 
+# Archive past terms for every user - run at each term rollover (e.g. from cron)
+@app.cli.command('archive-attendance')
+def archive_attendance():
+    """Move attendance records from past terms into the archive"""
+    archive = Student.archive_old_records()
+    print(f"Archived {archive['archivedRecords']} records from before {archive['archivedBefore']}")
+
 if __name__ == '__main__':
     port = Config.PORT
     print(f'Starting server on http://localhost:{port}')
@@ -16,3 +16,12 @@ class Config:
     JWT_EXPIRE = os.getenv('JWT_EXPIRE', '7d')
     PORT = int(os.getenv('PORT', 5000))
     DEBUG = os.getenv('FLASK_ENV') == 'development'
+    
+    # Attendance archival - months (1-12) in which a new term starts.
+    # Records from terms before the current one can be moved to the archive.
+    TERM_START_MONTHS = sorted(int(m) for m in os.getenv('TERM_START_MONTHS', '1,7').split(','))
+    
+    # Offline sync - how long processed operation IDs are remembered, and
+    # the largest batch accepted in one request
+    SYNC_DEDUPE_TTL_HOURS = int(os.getenv('SYNC_DEDUPE_TTL_HOURS', 72))
+    SYNC_MAX_OPERATIONS = int(os.getenv('SYNC_MAX_OPERATIONS', 500))
@@ -1,6 +1,42 @@
 from database import db
-from datetime import datetime
+from datetime import datetime, date, timedelta
+from sqlalchemy import func
 from sqlalchemy.dialects.postgresql import JSON
+from config import Config
+
+
+def term_start(day):
+    """Return the first day of the term that contains the given date"""
+    months = [m for m in Config.TERM_START_MONTHS if m <= day.month]
+    if months:
+        return date(day.year, months[-1], 1)
+    return date(day.year - 1, Config.TERM_START_MONTHS[-1], 1)
+
+def next_term_start(start):
+    """Return the first day of the term following the one starting at start"""
+    months = [m for m in Config.TERM_START_MONTHS if m > start.month]
+    if months:
+        return date(start.year, months[0], 1)
+    return date(start.year + 1, Config.TERM_START_MONTHS[0], 1)
+
+def current_term_start():
+    """Return the first day of the current term"""
+    return term_start(datetime.utcnow().date())
+
+def covers_archive(start, end=None):
+    """Check whether a date range reaches into past terms"""
+    if start is None:
+        # An open-ended range with only a 'to' date reaches back to the first term
+        return end is not None
+    return start < current_term_start()
+
+def filter_dates(query, column, start=None, end=None):
+    """Restrict a query to dates between start and end (both inclusive)"""
+    if start:
+        query = query.filter(column >= start)
+    if end:
+        query = query.filter(column <= end)
+    return query
 
 class User(db.Model):
     """User model"""
@@ -15,6 +51,7 @@ class User(db.Model):
     
     # Relationship
     students = db.relationship('Student', backref='user', lazy=True, cascade='all, delete-orphan')
+    sync_operations = db.relationship('SyncOperation', backref='user', lazy=True, cascade='all, delete-orphan')
     
     def to_dict(self):
         return {
@@ -34,12 +71,73 @@ class User(db.Model):
         }
 
 
+class SyncOperation(db.Model):
+    """Result of a processed sync operation, kept so client retries are not applied twice"""
+    __tablename__ = 'sync_operations'
+    __table_args__ = (db.UniqueConstraint('user_id', 'operation_id'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    operation_id = db.Column(db.String(64), nullable=False)
+    operation_type = db.Column(db.String(20))  # 'add', 'attendance' or 'delete'
+    status = db.Column(db.Integer, nullable=False)
+    message = db.Column(db.String(255))
+    student_id = db.Column(db.Integer, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    def to_dict(self):
+        return {
+            'id': self.operation_id,
+            'status': self.status,
+            'message': self.message,
+            'studentId': str(self.student_id) if self.student_id else None
+        }
+    
+    @staticmethod
+    def find_processed(user_id, operation_ids):
+        """Find already processed operations, keyed by operation ID"""
+        operations = SyncOperation.query.filter(
+            SyncOperation.user_id == user_id,
+            SyncOperation.operation_id.in_(operation_ids)
+        ).all()
+        return {operation.operation_id: operation for operation in operations}
+    
+    @staticmethod
+    def prune_expired():
+        """Forget operations older than the dedupe window"""
+        cutoff = datetime.utcnow() - timedelta(hours=Config.SYNC_DEDUPE_TTL_HOURS)
+        SyncOperation.query.filter(
+            SyncOperation.created_at < cutoff
+        ).delete(synchronize_session=False)
+
+
 class AttendanceRecord(db.Model):
     """Attendance record model"""
     __tablename__ = 'attendance_records'
     
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False, index=True)
+    status = db.Column(db.String(50), nullable=False)  # 'present' or 'absent'
+    time = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'date': self.date.isoformat(),
+            'status': self.status,
+            'time': self.time
+        }
+
+
+class ArchivedAttendanceRecord(db.Model):
+    """Attendance record moved out of the hot table after its term ended"""
+    __tablename__ = 'archived_attendance_records'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id', ondelete='CASCADE'), nullable=False, index=True)
+    term_start = db.Column(db.Date, nullable=False, index=True)
     date = db.Column(db.Date, nullable=False)
     status = db.Column(db.String(50), nullable=False)  # 'present' or 'absent'
     time = db.Column(db.String(255))
@@ -54,6 +152,25 @@ class AttendanceRecord(db.Model):
         }
 
 
+class AttendanceTermSummary(db.Model):
+    """Per-student attendance counts for an archived term"""
+    __tablename__ = 'attendance_term_summaries'
+    __table_args__ = (db.UniqueConstraint('student_id', 'term_start'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id', ondelete='CASCADE'), nullable=False, index=True)
+    term_start = db.Column(db.Date, nullable=False)
+    present = db.Column(db.Integer, default=0)
+    absent = db.Column(db.Integer, default=0)
+    
+    def to_dict(self):
+        return {
+            'term': self.term_start.isoformat(),
+            'present': self.present,
+            'absent': self.absent
+        }
+
+
 class Student(db.Model):
     """Student model"""
     __tablename__ = 'students'
@@ -72,10 +189,20 @@ class Student(db.Model):
     
     # Relationship
     attendance_records = db.relationship('AttendanceRecord', backref='student', lazy=True, cascade='all, delete-orphan')
+    archived_records = db.relationship('ArchivedAttendanceRecord', backref='student', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    term_summaries = db.relationship('AttendanceTermSummary', backref='student', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
     
-    def to_dict(self):
+    def history_records(self, start=None, end=None):
+        """Get attendance records between start and end, including archived ones when the range covers past terms"""
+        return Student.records_by_student(self.user_id, start, end, [self.id]).get(self.id, [])
+    
+    def to_dict(self, records=None):
+        """Serialize a student, with the given records (default: hot records) as history"""
+        if records is None:
+            records = self.attendance_records
+        
         history = []
-        for record in self.attendance_records:
+        for record in records:
             history.append({
                 'date': record.date.isoformat(),
                 'status': record.status,
@@ -95,7 +222,7 @@ class Student(db.Model):
         }
     
     @staticmethod
-    def create(user_id, name, class_name=None, image=None, mobile_number=None, address=None):
+    def create(user_id, name, class_name=None, image=None, mobile_number=None, address=None, commit=True):
         """Create a new student"""
         student = Student(
             name=name.strip(),
@@ -106,7 +233,10 @@ class Student(db.Model):
             user_id=user_id
         )
         db.session.add(student)
-        db.session.commit()
+        if commit:
+            db.session.commit()
+        else:
+            db.session.flush()
         return student
     
     @staticmethod
@@ -131,7 +261,7 @@ class Student(db.Model):
             Student.name.ilike(name)
         ).first()
     
-    def update_attendance(self, date, status):
+    def update_attendance(self, date, status, commit=True):
         """Mark attendance for a student"""
         from datetime import datetime as dt
         
@@ -141,21 +271,63 @@ class Student(db.Model):
         else:
             date_obj = date
         
-        # Check if attendance already marked for this date
-        existing_record = AttendanceRecord.query.filter_by(
-            student_id=self.id,
-            date=date_obj
-        ).first()
+        # Days from past terms are written straight to the archive
+        is_past_term = date_obj < current_term_start()
+        existing_record = None
+        summary = None
+        
+        if is_past_term:
+            existing_record = ArchivedAttendanceRecord.query.filter_by(
+                student_id=self.id,
+                date=date_obj
+            ).first()
+        
+        # Check if attendance already marked for this date (past-term records
+        # stay in the hot table until the next archive run)
+        if not existing_record:
+            existing_record = AttendanceRecord.query.filter_by(
+                student_id=self.id,
+                date=date_obj
+            ).first()
+        
+        if is_past_term and not isinstance(existing_record, AttendanceRecord):
+            term = term_start(date_obj)
+            summary = AttendanceTermSummary.query.filter_by(
+                student_id=self.id,
+                term_start=term
+            ).first()
+            if not summary:
+                summary = AttendanceTermSummary(
+                    student_id=self.id,
+                    term_start=term,
+                    present=0,
+                    absent=0
+                )
+                db.session.add(summary)
         
         if existing_record:
             # Update existing record
             if existing_record.status == 'present':
                 self.present -= 1
+                if summary:
+                    summary.present -= 1
             else:
                 self.absent -= 1
+                if summary:
+                    summary.absent -= 1
             
             existing_record.status = status
             existing_record.time = datetime.utcnow().strftime('%H:%M:%S')
+        elif summary:
+            # Add new archived record
+            record = ArchivedAttendanceRecord(
+                student_id=self.id,
+                term_start=summary.term_start,
+                date=date_obj,
+                status=status,
+                time=datetime.utcnow().strftime('%H:%M:%S')
+            )
+            db.session.add(record)
         else:
             # Add new record
             record = AttendanceRecord(
@@ -166,6 +338,12 @@ class Student(db.Model):
             )
             db.session.add(record)
         
+        if summary:
+            if status == 'present':
+                summary.present += 1
+            else:
+                summary.absent += 1
+        
         # Update counts
         if status == 'present':
             self.present += 1
@@ -173,34 +351,173 @@ class Student(db.Model):
             self.absent += 1
         
         self.updated_at = datetime.utcnow()
-        db.session.commit()
+        if commit:
+            db.session.commit()
         
         return self
     
     @staticmethod
-    def delete(student_id, user_id):
+    def delete(student_id, user_id, commit=True):
         """Delete a student"""
         student = Student.query.filter_by(id=student_id, user_id=user_id).first()
         if student:
+            # Bulk-delete the archive so years of rows are not loaded one by one
+            ArchivedAttendanceRecord.query.filter_by(student_id=student.id).delete(synchronize_session=False)
+            AttendanceTermSummary.query.filter_by(student_id=student.id).delete(synchronize_session=False)
+            
+            # Student IDs can be reused, so sync results must not point at the deleted one
+            SyncOperation.query.filter_by(student_id=student.id).update(
+                {'student_id': None},
+                synchronize_session='evaluate'
+            )
             db.session.delete(student)
-            db.session.commit()
+            if commit:
+                db.session.commit()
             return True
         return False
     
     @staticmethod
-    def get_stats(user_id):
-        """Get attendance statistics for a user"""
-        students = Student.query.filter_by(user_id=user_id).all()
+    def archive_old_records(user_id=None):
+        """Move attendance records from past terms into the archive, one term at a time"""
+        boundary = current_term_start()
+        archived_records = 0
+        terms = []
         
-        total_students = len(students)
+        while True:
+            oldest = Student._past_term_records(user_id, boundary).with_entities(
+                func.min(AttendanceRecord.date)
+            ).scalar()
+            if oldest is None:
+                break
+            
+            term = term_start(oldest)
+            term_end = min(next_term_start(term), boundary)
+            
+            records = Student._past_term_records(user_id, term_end).filter(
+                AttendanceRecord.date >= term
+            ).all()
+            
+            summary_query = AttendanceTermSummary.query.filter_by(term_start=term)
+            if user_id is not None:
+                summary_query = summary_query.join(Student).filter(Student.user_id == user_id)
+            summaries = {summary.student_id: summary for summary in summary_query.all()}
+            
+            for record in records:
+                summary = summaries.get(record.student_id)
+                if not summary:
+                    summary = AttendanceTermSummary(
+                        student_id=record.student_id,
+                        term_start=term,
+                        present=0,
+                        absent=0
+                    )
+                    db.session.add(summary)
+                    summaries[record.student_id] = summary
+                
+                if record.status == 'present':
+                    summary.present += 1
+                else:
+                    summary.absent += 1
+                
+                db.session.add(ArchivedAttendanceRecord(
+                    student_id=record.student_id,
+                    term_start=term,
+                    date=record.date,
+                    status=record.status,
+                    time=record.time,
+                    created_at=record.created_at
+                ))
+                db.session.delete(record)
+            
+            # Commit each term separately to keep transactions small
+            db.session.commit()
+            
+            archived_records += len(records)
+            terms.append(term.isoformat())
+        
+        return {
+            'archivedRecords': archived_records,
+            'archivedBefore': boundary.isoformat(),
+            'terms': terms
+        }
+    
+    @staticmethod
+    def _past_term_records(user_id, before):
+        """Query hot attendance records dated before the given day"""
+        query = AttendanceRecord.query.filter(AttendanceRecord.date < before)
+        if user_id is not None:
+            query = query.join(Student).filter(Student.user_id == user_id)
+        return query
+    
+    @staticmethod
+    def _archived_counts(user_id, start=None, end=None):
+        """Count archived present/absent records for a user between start and end"""
+        last_day = current_term_start() - timedelta(days=1)
+        if end is None or end > last_day:
+            end = last_day
+        
+        present = 0
+        absent = 0
+        partial_terms = []
+        
+        query = AttendanceTermSummary.query.join(Student).filter(
+            Student.user_id == user_id,
+            AttendanceTermSummary.term_start <= end
+        )
+        if start:
+            query = query.filter(AttendanceTermSummary.term_start >= term_start(start))
+        
+        # Whole terms come from the summaries, partly covered ones from the archive
+        for summary in query.all():
+            if (not start or summary.term_start >= start) and next_term_start(summary.term_start) <= end + timedelta(days=1):
+                present += summary.present
+                absent += summary.absent
+            else:
+                partial_terms.append(summary.term_start)
+        
+        if partial_terms:
+            query = db.session.query(
+                ArchivedAttendanceRecord.status,
+                func.count(ArchivedAttendanceRecord.id)
+            ).join(Student).filter(
+                Student.user_id == user_id,
+                ArchivedAttendanceRecord.term_start.in_(set(partial_terms))
+            )
+            query = filter_dates(query, ArchivedAttendanceRecord.date, start, end)
+            
+            for status, count in query.group_by(ArchivedAttendanceRecord.status).all():
+                if status == 'present':
+                    present += count
+                else:
+                    absent += count
+        
+        return present, absent
+    
+    @staticmethod
+    def get_stats(user_id, start=None, end=None):
+        """Get attendance statistics for a user"""
+        total_students = Student.query.filter_by(user_id=user_id).count()
         total_present = 0
         total_absent = 0
-        total_records = 0
         
-        for student in students:
-            total_present += student.present
-            total_absent += student.absent
-            total_records += len(student.attendance_records)
+        query = db.session.query(
+            AttendanceRecord.status,
+            func.count(AttendanceRecord.id)
+        ).join(Student).filter(Student.user_id == user_id)
+        query = filter_dates(query, AttendanceRecord.date, start, end)
+        
+        for status, count in query.group_by(AttendanceRecord.status).all():
+            if status == 'present':
+                total_present += count
+            else:
+                total_absent += count
+        
+        if covers_archive(start, end):
+            archived_present, archived_absent = Student._archived_counts(user_id, start, end)
+            total_present += archived_present
+            total_absent += archived_absent
+        
+        total_records = total_present + total_absent
         
         average_attendance = 0
         if total_records > 0:
@@ -215,9 +532,33 @@ class Student(db.Model):
         }
     
     @staticmethod
-    def get_class_wise_attendance(user_id):
+    def records_by_student(user_id, start=None, end=None, student_ids=None):
+        """Load a user's attendance records between start and end, grouped by student"""
+        models = [AttendanceRecord]
+        if covers_archive(start, end):
+            models.append(ArchivedAttendanceRecord)
+        
+        records_by_student = {}
+        
+        for model in models:
+            query = model.query.join(Student).filter(Student.user_id == user_id)
+            query = filter_dates(query, model.date, start, end)
+            if student_ids is not None:
+                query = query.filter(model.student_id.in_(student_ids))
+            
+            for record in query.all():
+                records_by_student.setdefault(record.student_id, []).append(record)
+        
+        for records in records_by_student.values():
+            records.sort(key=lambda record: record.date)
+        
+        return records_by_student
+    
+    @staticmethod
+    def get_class_wise_attendance(user_id, start=None, end=None):
         """Get class-wise attendance grouped by class"""
         students = Student.query.filter_by(user_id=user_id).all()
+        records_by_student = Student.records_by_student(user_id, start, end)
         
         class_wise_data = {}
         
@@ -236,7 +577,7 @@ class Student(db.Model):
             student_absent = 0
             attendance_records = []
             
-            for record in student.attendance_records:
+            for record in records_by_student.get(student.id, []):
                 date_str = record.date.strftime('%d/%m/%Y')
                 if record.status == 'present':
                     student_present += 1
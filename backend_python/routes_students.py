@@ -1,10 +1,23 @@
+from datetime import datetime
 from flask import Blueprint, request, jsonify
+from sqlalchemy.exc import IntegrityError
+from config import Config
 from database import db
-from models import Student
+from models import Student, SyncOperation
 from auth import protect
 
 students_bp = Blueprint('students', __name__, url_prefix='/api/students')
 
+def get_date_range():
+    """Read the optional from/to (YYYY-MM-DD) query parameters"""
+    start = request.args.get('from')
+    end = request.args.get('to')
+    
+    start = datetime.strptime(start, '%Y-%m-%d').date() if start else None
+    end = datetime.strptime(end, '%Y-%m-%d').date() if end else None
+    
+    return start, end
+
 @students_bp.route('/add', methods=['POST'])
 @protect
 def add_student():
@@ -48,6 +61,7 @@ def get_students():
     try:
         user_id = request.user['id']
         search = request.args.get('search', '')
+        start, end = get_date_range()
         
         students = Student.find_all_by_user(user_id, search)
         
@@ -59,8 +73,16 @@ def get_students():
             total_present += student.present
             total_absent += student.absent
         
+        # Load every student's history in one pass
+        records_by_student = Student.records_by_student(
+            user_id, start, end, [student.id for student in students]
+        )
+        
         # Format response
-        formatted_students = [student.to_dict() for student in students]
+        formatted_students = [
+            student.to_dict(records_by_student.get(student.id, []))
+            for student in students
+        ]
         
         return jsonify({
             'success': True,
@@ -70,6 +92,8 @@ def get_students():
             'students': formatted_students
         }), 200
     
+    except ValueError:
+        return jsonify({'message': 'Dates must be in YYYY-MM-DD format'}), 400
     except Exception as e:
         return jsonify({'message': str(e)}), 500
 
@@ -79,6 +103,7 @@ def get_student(student_id):
     """Get a single student"""
     try:
         user_id = request.user['id']
+        start, end = get_date_range()
         
         student = Student.find_by_id(student_id, user_id)
         
@@ -87,9 +112,11 @@ def get_student(student_id):
         
         return jsonify({
             'success': True,
-            'student': student.to_dict()
+            'student': student.to_dict(student.history_records(start, end))
         }), 200
     
+    except ValueError:
+        return jsonify({'message': 'Dates must be in YYYY-MM-DD format'}), 400
     except Exception as e:
         return jsonify({'message': str(e)}), 500
 
@@ -150,14 +177,17 @@ def get_stats():
     """Get attendance statistics"""
     try:
         user_id = request.user['id']
+        start, end = get_date_range()
         
-        stats = Student.get_stats(user_id)
+        stats = Student.get_stats(user_id, start, end)
         
         return jsonify({
             'success': True,
             'stats': stats
         }), 200
     
+    except ValueError:
+        return jsonify({'message': 'Dates must be in YYYY-MM-DD format'}), 400
     except Exception as e:
         return jsonify({'message': str(e)}), 500
 
@@ -167,13 +197,239 @@ def get_class_wise_attendance():
     """Get class-wise attendance"""
     try:
         user_id = request.user['id']
+        start, end = get_date_range()
         
-        class_wise_data = Student.get_class_wise_attendance(user_id)
+        class_wise_data = Student.get_class_wise_attendance(user_id, start, end)
         
         return jsonify({
             'success': True,
             'data': class_wise_data
         }), 200
     
+    except ValueError:
+        return jsonify({'message': 'Dates must be in YYYY-MM-DD format'}), 400
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
+@students_bp.route('/archive', methods=['POST'])
+@protect
+def archive_attendance():
+    """Move attendance records from past terms into the archive"""
+    try:
+        user_id = request.user['id']
+        
+        archive = Student.archive_old_records(user_id)
+        
+        return jsonify({
+            'message': 'Attendance archived successfully',
+            'archive': archive
+        }), 200
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': str(e)}), 500
+
+SYNC_OPERATION_TYPES = ['add', 'attendance', 'delete']
+SYNC_STUDENT_FIELDS = ['name', 'class', 'image', 'mobileNumber', 'address']
+MAX_STUDENT_ID = 2 ** 63 - 1
+
+def sync_reference_error(operation):
+    """Check the student reference of an operation, returning an error message if invalid"""
+    student_id = operation.get('studentId')
+    reference = operation.get('studentOperationId')
+    
+    if student_id is not None:
+        if isinstance(student_id, str):
+            try:
+                student_id = int(student_id)
+            except ValueError:
+                pass
+        
+        valid_id = isinstance(student_id, int) and not isinstance(student_id, bool)
+        if not valid_id or not 0 < student_id <= MAX_STUDENT_ID:
+            return 'studentId must be a positive integer'
+    
+    if reference is not None and not isinstance(reference, str):
+        return 'studentOperationId must be a string'
+    
+    return None
+
+def find_sync_student(user_id, operation, processed):
+    """Find the student an operation refers to, by ID or by the 'add' operation that created it"""
+    student_id = operation.get('studentId')
+    
+    reference = operation.get('studentOperationId')
+    if not student_id and reference:
+        added = processed.get(reference) or SyncOperation.query.filter_by(
+            user_id=user_id,
+            operation_id=reference
+        ).first()
+        student_id = added.student_id if added and added.operation_type == 'add' else None
+    
+    try:
+        student_id = int(student_id)
+    except (TypeError, ValueError):
+        return None
+    
+    return Student.find_by_id(student_id, user_id)
+
+def apply_sync_operation(user_id, operation, processed):
+    """Apply one sync operation without committing, returning (status, message, student_id)"""
+    operation_type = operation.get('type')
+    
+    if operation_type == 'add':
+        for field in SYNC_STUDENT_FIELDS:
+            value = operation.get(field)
+            if value is not None and not isinstance(value, str):
+                return 400, f'{field} must be a string', None
+        
+        name = (operation.get('name') or '').strip()
+        
+        if not name:
+            return 400, 'Student name is required', None
+        
+        existing = Student.find_existing(user_id, name)
+        if existing:
+            return 409, 'Student already exists', existing.id
+        
+        student = Student.create(
+            user_id,
+            name,
+            class_name=operation.get('class'),
+            image=operation.get('image'),
+            mobile_number=operation.get('mobileNumber'),
+            address=operation.get('address'),
+            commit=False
+        )
+        return 201, 'Student added successfully', student.id
+    
+    if operation_type == 'attendance':
+        date = operation.get('date')
+        status = operation.get('status')
+        
+        if not date or not status:
+            return 400, 'Date and status are required', None
+        
+        if status not in ['present', 'absent']:
+            return 400, 'Status must be present or absent', None
+        
+        try:
+            date = datetime.strptime(date, '%Y-%m-%d').date()
+        except (TypeError, ValueError):
+            return 400, 'Dates must be in YYYY-MM-DD format', None
+        
+        error = sync_reference_error(operation)
+        if error:
+            return 400, error, None
+        
+        student = find_sync_student(user_id, operation, processed)
+        
+        if not student:
+            return 404, 'Student not found', None
+        
+        student.update_attendance(date, status, commit=False)
+        return 200, 'Attendance marked successfully', student.id
+    
+    if operation_type == 'delete':
+        error = sync_reference_error(operation)
+        if error:
+            return 400, error, None
+        
+        student = find_sync_student(user_id, operation, processed)
+        
+        if not student or not Student.delete(student.id, user_id, commit=False):
+            return 404, 'Student not found', None
+        
+        # The student is gone - don't leave an id that a reused row could match
+        return 200, 'Student deleted successfully', None
+    
+    return 400, 'Operation type must be add, attendance or delete', None
+
+def apply_sync_batch(user_id, operations):
+    """Apply a batch of operations in one transaction, skipping already processed IDs"""
+    SyncOperation.prune_expired()
+    
+    operation_ids = [
+        operation.get('id') for operation in operations
+        if isinstance(operation, dict) and isinstance(operation.get('id'), str)
+    ]
+    processed = SyncOperation.find_processed(user_id, operation_ids)
+    
+    results = []
+    
+    for operation in operations:
+        operation_id = operation.get('id') if isinstance(operation, dict) else None
+        
+        if not isinstance(operation_id, str) or not operation_id or len(operation_id) > 64:
+            results.append({
+                'id': operation_id,
+                'status': 400,
+                'message': 'Operation id must be a string of at most 64 characters',
+                'studentId': None
+            })
+            continue
+        
+        # Retried operation - replay the stored result instead of applying it again
+        if operation_id in processed:
+            result = processed[operation_id].to_dict()
+            result['duplicate'] = True
+            results.append(result)
+            continue
+        
+        status, message, student_id = apply_sync_operation(user_id, operation, processed)
+        
+        operation_type = operation.get('type')
+        
+        record = SyncOperation(
+            user_id=user_id,
+            operation_id=operation_id,
+            operation_type=operation_type if operation_type in SYNC_OPERATION_TYPES else None,
+            status=status,
+            message=message,
+            student_id=student_id
+        )
+        db.session.add(record)
+        processed[operation_id] = record
+        
+        results.append(record.to_dict())
+    
+    db.session.commit()
+    
+    return results
+
+@students_bp.route('/sync', methods=['POST'])
+@protect
+def sync():
+    """Apply a batch of queued offline operations"""
+    try:
+        data = request.get_json() or {}
+        user_id = request.user['id']
+        
+        if not isinstance(data, dict):
+            return jsonify({'message': 'Request body must be a JSON object'}), 400
+        
+        operations = data.get('operations')
+        
+        if not isinstance(operations, list) or not operations:
+            return jsonify({'message': 'Operations are required'}), 400
+        
+        if len(operations) > Config.SYNC_MAX_OPERATIONS:
+            return jsonify({
+                'message': f'A batch can contain at most {Config.SYNC_MAX_OPERATIONS} operations'
+            }), 400
+        
+        try:
+            results = apply_sync_batch(user_id, operations)
+        except IntegrityError:
+            # A concurrent retry of the same batch committed first - replay its results
+            db.session.rollback()
+            results = apply_sync_batch(user_id, operations)
+        
+        return jsonify({
+            'success': True,
+            'results': results
+        }), 200
+    
     except Exception as e:
+        db.session.rollback()
         return jsonify({'message': str(e)}), 500